@@ -5,6 +5,7 @@ import numpy as np
 from scipy import stats
 from sklearn.ensemble import IsolationForest
 from sklearn.linear_model import LinearRegression
+from filters import build_period, ensure_numeric, period_pct_change
 
 def advanced_anomaly_alerts(pct_series: pd.Series, contamination: float = 0.1) -> pd.DataFrame:
     """
@@ -18,7 +19,7 @@ def advanced_anomaly_alerts(pct_series: pd.Series, contamination: float = 0.1) -
         pd.DataFrame: A DataFrame with anomalies (rows where the model flags as -1).
     """
     # Reshape data to a 2D array.
-    X = pct_series.values.reshape(-1, 1)
+    X = pct_series.to_numpy(dtype="float64", na_value=np.nan).reshape(-1, 1)
     # Fit an IsolationForest.
     clf = IsolationForest(contamination=contamination, random_state=42)
     preds = clf.fit_predict(X)
@@ -75,11 +76,11 @@ def ai_based_alerts_forecasting(data: pd.DataFrame):
         return
 
     # Convert Tons to numeric.
-    data["Tons"] = pd.to_numeric(data["Tons"], errors="coerce")
+    data = ensure_numeric(data, "Tons")
     
     # Create a "Period" field if not already present.
     if "Period" not in data.columns:
-        data["Period"] = data["Month"] + "-" + data["Year"].astype(str)
+        data = data.assign(Period=build_period(data))
     
     # --- Tab Layout: Alerts and Forecasting ---
     tab_alerts, tab_forecasting = st.tabs(["Alerts", "Forecasting"])
@@ -88,11 +89,12 @@ def ai_based_alerts_forecasting(data: pd.DataFrame):
     with tab_alerts:
         st.subheader("Competitor Alerts")
         # Aggregate competitor volumes by Period.
-        comp_period = data.groupby(["Consignee", "Period"])["Tons"].sum().unstack(fill_value=0)
+        comp_period = data.groupby(["Consignee", "Period"], observed=True)["Tons"].sum().unstack(fill_value=0)
         
-        # Calculate period-over-period percentage change.
-        pct_change = comp_period.pct_change(axis=1) * 100
-        pct_change = pct_change.round(2)
+        # Calculate period-over-period percentage change on the raw matrix; changes from zero are NaN.
+        pct_change = pd.DataFrame(
+            period_pct_change(comp_period.to_numpy()), index=comp_period.index, columns=comp_period.columns
+        ).round(2)
         
         # Basic threshold alerts.
         threshold = st.slider("Alert Threshold (% Change)", min_value=0, max_value=100, value=20, step=5, key="alert_threshold")
@@ -148,7 +150,7 @@ def ai_based_alerts_forecasting(data: pd.DataFrame):
     with tab_forecasting:
         st.subheader("Overall Market Forecast")
         # Aggregate overall market volume by Period.
-        market = data.groupby("Period")["Tons"].sum().reset_index()
+        market = data.groupby("Period", observed=True)["Tons"].sum().reset_index()
         market = market.sort_values("Period").reset_index(drop=True)
         st.markdown("#### Historical Market Data")
         st.dataframe(market)
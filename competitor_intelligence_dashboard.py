@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import numpy as np
 from datetime import datetime
+from filters import build_period, ensure_numeric, period_chart_frame, sorted_options, with_totals
 
 def competitor_intelligence_dashboard(data: pd.DataFrame):
     st.title("🤝 Competitor Intelligence Dashboard")
@@ -18,28 +20,31 @@ def competitor_intelligence_dashboard(data: pd.DataFrame):
         return
 
     # Convert Tons to numeric.
-    data["Tons"] = pd.to_numeric(data["Tons"], errors="coerce")
+    data = ensure_numeric(data, "Tons")
     
     # Create "Period" field if not present.
     if "Period" not in data.columns:
-        data["Period"] = data["Month"] + "-" + data["Year"].astype(str)
+        data = data.assign(Period=build_period(data))
     
     # --- Competitor Summary Metrics ---
     # Assuming each unique "Consignee" is a competitor.
-    comp_summary = data.groupby("Consignee")["Tons"].sum().reset_index()
+    comp_summary = data.groupby("Consignee", observed=True)["Tons"].sum().reset_index()
     total_comp_volume = comp_summary["Tons"].sum()
     avg_volume = comp_summary["Tons"].mean() if not comp_summary.empty else 0
 
-    # Calculate recent period-over-period growth per competitor.
-    growth_list = []
-    for comp in comp_summary["Consignee"]:
-        comp_data = data[data["Consignee"] == comp].groupby("Period")["Tons"].sum().sort_index()
-        if len(comp_data) >= 2 and comp_data.iloc[-2] != 0:
-            growth = ((comp_data.iloc[-1] - comp_data.iloc[-2]) / comp_data.iloc[-2]) * 100
-            growth_list.append(growth)
-        else:
-            growth_list.append(0)
-    comp_summary["Recent Growth (%)"] = growth_list
+    # Calculate recent period-over-period growth per competitor from its last two periods.
+    comp_period = data.groupby(["Consignee", "Period"], observed=True)["Tons"].sum()
+    by_comp = comp_period.groupby(level="Consignee", observed=True)
+    last = by_comp.nth(-1).droplevel("Period")
+    prev = by_comp.nth(-2).droplevel("Period").reindex(last.index)
+    last_values = last.to_numpy(dtype="float64", na_value=np.nan)
+    prev_values = prev.to_numpy(dtype="float64", na_value=np.nan)
+    # Branchless, zero-safe divide: competitors without a non-zero previous period get 0.
+    has_prev = ~np.isnan(prev_values) & (prev_values != 0)
+    growth = np.where(has_prev, (last_values - prev_values) / np.where(has_prev, prev_values, 1) * 100, 0)
+    comp_summary["Recent Growth (%)"] = (
+        pd.Series(growth, index=last.index).reindex(comp_summary["Consignee"]).fillna(0).to_numpy()
+    )
     best_growth = comp_summary["Recent Growth (%)"].max() if not comp_summary.empty else 0
     worst_growth = comp_summary["Recent Growth (%)"].min() if not comp_summary.empty else 0
 
@@ -66,14 +71,14 @@ def competitor_intelligence_dashboard(data: pd.DataFrame):
         # Toggle to view only top 10 or all competitors.
         show_top_exporters = st.checkbox("Show only top 10 competitors", value=True, key="show_top_exporters")
         if show_top_exporters:
-            candidate_competitors = data.groupby("Consignee")["Tons"].sum().nlargest(10).reset_index()["Consignee"].tolist()
+            candidate_competitors = data.groupby("Consignee", observed=True)["Tons"].sum().nlargest(10).reset_index()["Consignee"].tolist()
         else:
-            candidate_competitors = sorted(data["Consignee"].dropna().unique().tolist())
+            candidate_competitors = sorted_options(data["Consignee"])
             
         if candidate_competitors:
             selected_competitor = st.selectbox("Select a Competitor:", candidate_competitors, key="ci_selected_competitor")
             comp_data = data[data["Consignee"] == selected_competitor]
-            exporter_breakdown = comp_data.groupby("Exporter")["Tons"].sum().reset_index().sort_values("Tons", ascending=False)
+            exporter_breakdown = comp_data.groupby("Exporter", observed=True)["Tons"].sum().reset_index().sort_values("Tons", ascending=False)
             st.markdown(f"### Exporters for {selected_competitor}")
             fig_export = px.bar(
                 exporter_breakdown,
@@ -93,20 +98,24 @@ def competitor_intelligence_dashboard(data: pd.DataFrame):
     # ----- Tab 3: Trends & Growth -----
     with tab_trends:
         st.subheader("Competitor Trends Over Time")
-        trends_df = data.groupby(["Consignee", "Period"])["Tons"].sum().unstack(fill_value=0)
-        st.line_chart(trends_df)
+        trends_df = data.groupby(["Consignee", "Period"], observed=True)["Tons"].sum().unstack(fill_value=0)
+        st.line_chart(period_chart_frame(trends_df))
         
         st.markdown("---")
         st.subheader("Detailed Growth Analysis")
         show_top_growth = st.checkbox("Show only top 10 competitors", value=True, key="show_top_growth")
         if show_top_growth:
-            candidate_for_growth = data.groupby("Consignee")["Tons"].sum().nlargest(10).reset_index()["Consignee"].tolist()
+            candidate_for_growth = data.groupby("Consignee", observed=True)["Tons"].sum().nlargest(10).reset_index()["Consignee"].tolist()
         else:
-            candidate_for_growth = sorted(data["Consignee"].dropna().unique().tolist())
+            candidate_for_growth = sorted_options(data["Consignee"])
             
         if candidate_for_growth:
             selected_for_growth = st.selectbox("Select Competitor for Growth Analysis:", candidate_for_growth, key="ci_growth")
-            comp_trend = data[data["Consignee"] == selected_for_growth].groupby("Period")["Tons"].sum()
+            # Read the competitor's row from the trends pivot instead of filtering and regrouping the data;
+            # periods without shipments are zero-filled there, so drop them from the series.
+            # A competitor without any valid Period has no row and comes back all zero.
+            comp_trend = trends_df.reindex([selected_for_growth], fill_value=0).iloc[0]
+            comp_trend = comp_trend[comp_trend != 0]
             growth_pct = comp_trend.pct_change() * 100
             growth_df = pd.DataFrame({
                 "Period": growth_pct.index,
@@ -121,14 +130,16 @@ def competitor_intelligence_dashboard(data: pd.DataFrame):
     with tab_detailed:
         st.subheader("Detailed Competitor Analysis")
         st.markdown("Select one or more competitors to compare detailed metrics and trends.")
-        all_competitors = sorted(data["Consignee"].dropna().unique().tolist())
+        all_competitors = sorted_options(data["Consignee"])
         # Default selection: all competitors.
         selected_comps = st.multiselect("Select Competitors:", all_competitors, default=all_competitors, key="ci_detailed")
         if selected_comps:
             detailed_data = data[data["Consignee"].isin(selected_comps)]
+            # One (Consignee, Period) aggregation feeds the comparison charts and every monthly pivot.
+            comp_period = detailed_data.groupby(["Consignee", "Period"], observed=True)["Tons"].sum()
             
             # Combined line chart for overall trends.
-            trends_comp = detailed_data.groupby(["Consignee", "Period"])["Tons"].sum().reset_index()
+            trends_comp = comp_period.reset_index()
             fig_compare = px.line(
                 trends_comp,
                 x="Period",
@@ -140,19 +151,9 @@ def competitor_intelligence_dashboard(data: pd.DataFrame):
             st.plotly_chart(fig_compare, use_container_width=True)
             
             # Create a pivot table for detailed volume.
-            pivot_table = detailed_data.pivot_table(
-                index="Consignee",
-                columns="Period",
-                values="Tons",
-                aggfunc="sum",
-                fill_value=0
-            )
-            # Add row totals.
-            pivot_table["Total"] = pivot_table.sum(axis=1)
-            # Add a total row.
-            total_row = pd.DataFrame(pivot_table.sum(axis=0)).T
-            total_row.index = ["Total"]
-            pivot_table_with_total = pd.concat([pivot_table, total_row])
+            pivot_table = comp_period.unstack("Period", fill_value=0)
+            # Add row and column totals.
+            pivot_table_with_total = with_totals(pivot_table)
             st.markdown("#### Detailed Volume Pivot Table (with Totals)")
             st.dataframe(pivot_table_with_total)
             
@@ -160,23 +161,14 @@ def competitor_intelligence_dashboard(data: pd.DataFrame):
             with st.expander("Monthly Analysis"):
                 st.markdown("##### Monthly Volume and Trends")
                 # Allow user to select periods for the pivot table.
-                all_periods = sorted(detailed_data["Period"].dropna().unique().tolist())
+                all_periods = sorted_options(detailed_data["Period"])
                 selected_periods = st.multiselect("Select Period(s):", all_periods, default=all_periods, key="ci_period")
-                monthly_pivot = detailed_data.pivot_table(
-                    index="Consignee",
-                    columns="Period",
-                    values="Tons",
-                    aggfunc="sum",
-                    fill_value=0
-                )
+                monthly_pivot = pivot_table
                 if selected_periods:
                     monthly_pivot = monthly_pivot[[col for col in monthly_pivot.columns if col in selected_periods]]
-                monthly_pivot["Total"] = monthly_pivot.sum(axis=1)
-                monthly_total_row = pd.DataFrame(monthly_pivot.sum(axis=0)).T
-                monthly_total_row.index = ["Total"]
-                monthly_pivot_with_total = pd.concat([monthly_pivot, monthly_total_row])
+                monthly_pivot_with_total = with_totals(monthly_pivot)
                 st.dataframe(monthly_pivot_with_total)
-                monthly_trends = detailed_data.groupby(["Consignee", "Period"])["Tons"].sum().reset_index()
+                monthly_trends = trends_comp
                 fig_monthly = px.line(
                     monthly_trends,
                     x="Period",
@@ -189,19 +181,11 @@ def competitor_intelligence_dashboard(data: pd.DataFrame):
             
             with st.expander("Yearly Analysis"):
                 st.markdown("##### Yearly Volume and Trends")
-                yearly_pivot = detailed_data.pivot_table(
-                    index="Consignee",
-                    columns="Year",
-                    values="Tons",
-                    aggfunc="sum",
-                    fill_value=0
-                )
-                yearly_pivot["Total"] = yearly_pivot.sum(axis=1)
-                yearly_total_row = pd.DataFrame(yearly_pivot.sum(axis=0)).T
-                yearly_total_row.index = ["Total"]
-                yearly_pivot_with_total = pd.concat([yearly_pivot, yearly_total_row])
+                comp_year = detailed_data.groupby(["Consignee", "Year"], observed=True)["Tons"].sum()
+                yearly_pivot = comp_year.unstack("Year", fill_value=0)
+                yearly_pivot_with_total = with_totals(yearly_pivot)
                 st.dataframe(yearly_pivot_with_total)
-                yearly_trends = detailed_data.groupby(["Consignee", "Year"])["Tons"].sum().reset_index()
+                yearly_trends = comp_year.reset_index()
                 fig_yearly = px.line(
                     yearly_trends,
                     x="Year",
@@ -4,11 +4,11 @@ import requests
 from io import StringIO
 import plotly.express as px
 import logging
-from datetime import datetime
 
 # Import configuration and smart filters
 import config
 from filters import smart_apply_filters as apply_filters
+from filters import build_period, normalize_month, period_datetimes
 
 # Import dashboard modules
 from market_overview_dashboard import market_overview_dashboard
@@ -25,6 +25,9 @@ from product_insights_dashboard import product_insights_dashboard
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Low-cardinality text columns that drive the dashboards' groupby/pivot keys.
+CATEGORICAL_COLUMNS = ("Consignee State", "Exporter", "Consignee")
+
 # -----------------------------------------------------------------------------
 # Query Parameters Update
 # -----------------------------------------------------------------------------
@@ -76,27 +79,44 @@ def preprocess_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Preprocess the dataset:
       - Convert 'Tons' to numeric (remove commas, trim spaces).
-      - Create a datetime column ('Period_dt') from Month and Year.
-      - Create an ordered categorical 'Period' (format "Mon-Year") for time‑series analysis.
+      - Create an ordered categorical 'Period' (format "Mon-Year") for time‑series analysis,
+        computed once here so dashboards never rebuild it per rerun.
+      - Create a datetime column ('Period_dt') from the Period categories.
+      - Store Consignee State, Exporter and Consignee as categoricals and Month as an ordered month categorical.
+      - Keep 'Tons' as float64 and downcast an integer 'Year' to int16.
     """
     for col in ["Tons"]:
         if col in df.columns:
             df[col] = df[col].astype(str).str.replace(",", "", regex=False).str.strip()
             df[col] = pd.to_numeric(df[col], errors="coerce")
     if "Month" in df.columns and "Year" in df.columns:
-        try:
-            df["Period_dt"] = df.apply(lambda row: datetime.strptime(f"{row['Month']} {row['Year']}", "%b %Y"), axis=1)
-        except Exception as e:
-            st.error("Error parsing 'Month' and 'Year'. Ensure they are in abbreviated format (e.g., Jan) and Year is numeric.")
-            logger.error("Error parsing Period: %s", e)
-            return df
-        df["Period"] = df["Period_dt"].dt.strftime("%b-%Y")
-        sorted_periods = sorted(df["Period_dt"].dropna().unique())
-        period_labels = [dt.strftime("%b-%Y") for dt in sorted_periods]
-        df["Period"] = pd.Categorical(df["Period"], categories=period_labels, ordered=True)
+        period = build_period(df)
+        unparsed = int((period.codes == -1).sum())
+        if unparsed:
+            st.error(f"Error parsing 'Month' and 'Year' in {unparsed:,} rows; they are left out of every period view. "
+                     "Ensure Month names a month (e.g., Jan) and Year is numeric.")
+            logger.error("Error parsing Period: %d rows without a valid Month/Year", unparsed)
+        df["Period"] = period
+        df["Period_dt"] = period_datetimes(period)
     else:
         st.error("Missing 'Month' or 'Year' columns.")
-    return df.convert_dtypes()
+    df = df.convert_dtypes(dtype_backend="pyarrow")
+    # Tons stays double precision: float32 sums lose cents on realistic totals.
+    # Year only needs int16, which halves the bytes each Year groupby reads.
+    if "Tons" in df.columns and df["Tons"].dtype.kind in "fiu":
+        df["Tons"] = df["Tons"].astype("double[pyarrow]")
+    if "Year" in df.columns and df["Year"].dtype.kind in "iu":
+        df["Year"] = df["Year"].astype("int16[pyarrow]")
+    # Categorical keys let every downstream groupby hash integer codes instead of strings.
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    # Month is always an ordered month categorical, so the Month filter lists months in calendar
+    # order whatever their spelling. Unparseable months (reported above with the Period) are kept
+    # after Dec rather than blanked, so the sidebar filter does not drop their rows.
+    if "Month" in df.columns:
+        df["Month"] = normalize_month(df["Month"], keep_unknown=True)
+    return df
 
 @st.cache_data(show_spinner=False)
 def load_csv_data(uploaded_file) -> pd.DataFrame:
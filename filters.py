@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from rapidfuzz import process, fuzz  # pip install rapidfuzz
 
 # Predefined month ordering for sorting
@@ -7,6 +8,149 @@ MONTH_ORDER = {
     "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
     "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12
 }
+MONTH_DTYPE = pd.CategoricalDtype(categories=list(MONTH_ORDER), ordered=True)
+
+def normalize_month(month: pd.Series, keep_unknown: bool = False) -> pd.Series:
+    """
+    Return Month as a MONTH_DTYPE categorical, accepting any case, surrounding
+    whitespace and longer names ("mar", " MARCH", "Sept"). Each distinct value is
+    normalised once; values that still do not name a month become NaN, or with
+    `keep_unknown` are kept verbatim as extra categories ordered after Dec.
+    """
+    if month.dtype == MONTH_DTYPE:
+        return month
+    codes, uniques = pd.factorize(month)
+    names = pd.Index(uniques, dtype=object).astype(str).str.strip()
+    month_codes = pd.Categorical(names.str[:3].str.title(), dtype=MONTH_DTYPE).codes
+    categories = list(MONTH_ORDER)
+    if keep_unknown:
+        unknown = names[month_codes == -1].unique()
+        month_codes = np.where(month_codes == -1, len(categories) + unknown.get_indexer(names), month_codes)
+        categories += unknown.tolist()
+    month_codes = np.append(month_codes, -1)[codes]
+    return pd.Series(pd.Categorical.from_codes(month_codes, categories=categories, ordered=True),
+                     index=month.index, name=month.name)
+
+def build_period(df: pd.DataFrame) -> pd.Categorical:
+    """
+    Build an ordered categorical 'Period' (format "Mon-Year") from Month and Year.
+    Periods are keyed by the integer code year*100 + month, so ordering is
+    chronological and display labels are only built once per unique period.
+    Rows whose Month or Year cannot be parsed get a missing Period.
+    """
+    month_codes = normalize_month(df["Month"]).cat.codes.to_numpy()
+    years = pd.to_numeric(df["Year"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    period_codes = years * 100 + month_codes + 1
+    valid = (month_codes >= 0) & ~np.isnan(years)
+    unique_codes = np.unique(period_codes[valid]).astype(np.int32)
+    codes = np.full(len(period_codes), -1, dtype=np.int32)
+    codes[valid] = np.searchsorted(unique_codes, period_codes[valid])
+    month_names = list(MONTH_ORDER)
+    labels = [f"{month_names[c % 100 - 1]}-{c // 100}" for c in unique_codes]
+    return pd.Categorical.from_codes(codes, categories=labels, ordered=True)
+
+def period_datetimes(period: pd.Categorical) -> pd.DatetimeIndex:
+    """
+    First-of-month datetime for each row of a 'Period' categorical. Each unique
+    period label is parsed once and broadcast through the category codes;
+    rows without a Period get NaT.
+    """
+    starts = pd.to_datetime(pd.Index(period.categories), format="%b-%Y")
+    return starts.take(period.codes, allow_fill=True, fill_value=pd.NaT)
+
+def ensure_numeric(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """
+    Return the DataFrame with `column` numeric.
+    The column is only converted (on a copy) when it is not numeric already,
+    so data typed once by the loader passes through without another scan.
+    """
+    if df[column].dtype.kind not in "fiu":
+        df = df.assign(**{column: pd.to_numeric(df[column], errors="coerce")})
+    return df
+
+def sorted_options(series: pd.Series) -> list:
+    """
+    Return the sorted distinct values of a column for use as widget options.
+    Categorical columns already hold their values in sort order, so only the
+    categories still in use are read instead of sorting the unique values.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.remove_unused_categories().cat.categories.tolist()
+    options = series.dropna().unique().tolist()
+    if series.name == "Month":
+        return sorted(options, key=lambda m: MONTH_ORDER.get(m, 99))
+    return sorted(options)
+
+@st.cache_data(show_spinner=False)
+def missing_columns(columns: tuple, required: tuple) -> list:
+    """Return the `required` columns absent from a schema; cached so it runs once per schema."""
+    present = set(columns)
+    return [col for col in required if col not in present]
+
+def with_totals(pivot: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return the pivot with a "Total" column and a "Total" row appended.
+    The result is written into one preallocated array, so no intermediate
+    frames or concat copies are made.
+    """
+    # Arrow-backed columns would otherwise come out as an object array; float
+    # pivots are summed in float64 so the totals do not drift on large volumes.
+    dtypes = [getattr(dtype, "numpy_dtype", dtype) for dtype in pivot.dtypes]
+    dtype = np.result_type(*dtypes) if dtypes else np.float64
+    if dtype.kind == "f":
+        dtype = np.promote_types(dtype, np.float64)
+    values = pivot.to_numpy(dtype=dtype)
+    row_totals = values.sum(axis=1)
+    out = np.empty((values.shape[0] + 1, values.shape[1] + 1), dtype=values.dtype)
+    out[:-1, :-1] = values
+    out[:-1, -1] = row_totals
+    out[-1, :-1] = values.sum(axis=0)
+    out[-1, -1] = row_totals.sum()
+    return pd.DataFrame(
+        out,
+        index=pivot.index.astype(object).append(pd.Index(["Total"])),
+        columns=pivot.columns.astype(object).append(pd.Index(["Total"])),
+    )
+
+def period_pct_change(values: np.ndarray) -> np.ndarray:
+    """
+    Period-over-period change in percent along the last axis (periods), for a
+    series or an entity x period matrix; the first period and changes from zero are NaN.
+    """
+    values = np.asarray(values, dtype="float64")
+    pct = np.full(values.shape, np.nan)
+    prev = values[..., :-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct[..., 1:] = np.where(prev == 0, np.nan, (values[..., 1:] - prev) / prev * 100)
+    return pct
+
+def period_chart_frame(pivot: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turn an entity x Period pivot into a frame for st.line_chart: one column per
+    entity and a datetime index, parsed once per period label, so the x axis
+    runs chronologically through the periods.
+    """
+    chart = pivot.T
+    chart.index = pd.to_datetime(pd.Index(pivot.columns.astype(str)), format="%b-%Y").rename("Period")
+    chart.columns = pivot.index.astype(str)
+    return chart
+
+def cap_rows(frame: pd.DataFrame, n: int) -> pd.DataFrame:
+    """
+    Keep the `n` rows of a pivot with the largest totals, in their original order,
+    so only a bounded table is serialized to the browser. A trailing "Total" row
+    is always kept and still reflects every row.
+    """
+    has_total = len(frame) > 0 and frame.index[-1] == "Total"
+    body_len = len(frame) - 1 if has_total else len(frame)
+    if body_len <= n:
+        return frame
+    body = frame.iloc[:body_len]
+    totals = body["Total"] if "Total" in body.columns else body.sum(axis=1)
+    keep = np.sort(np.argsort(-totals.to_numpy(dtype="float64"), kind="stable")[:n])
+    if has_total:
+        keep = np.append(keep, body_len)
+    return frame.iloc[keep]
 
 def classify_mark(mark: str, threshold: int = 70) -> str:
     """
@@ -22,6 +166,15 @@ def classify_mark(mark: str, threshold: int = 70) -> str:
         return best_match[0]
     return "Other"
 
+def classify_distinct(values: pd.Series, classify, missing: str = "Unknown") -> np.ndarray:
+    """
+    Label every row of `values` with `classify`, calling it once per distinct value
+    and broadcasting the labels through the factor codes; missing values get `missing`.
+    """
+    codes, uniques = pd.factorize(values)
+    labels = np.array([classify(value) for value in uniques] + [missing], dtype=object)
+    return labels[codes]
+
 def smart_apply_filters(df: pd.DataFrame):
     """
     Apply dynamic, interconnected filters to the DataFrame.
@@ -35,9 +188,7 @@ def smart_apply_filters(df: pd.DataFrame):
     if "Mark" in filtered_df.columns and "Product" not in filtered_df.columns:
         threshold_value = 70
         with st.spinner("Classifying products..."):
-            filtered_df["Product"] = filtered_df["Mark"].apply(
-                lambda x: classify_mark(x, threshold=threshold_value)
-            )
+            filtered_df["Product"] = classify_distinct(filtered_df["Mark"], lambda m: classify_mark(m, threshold=threshold_value))
     
     def dynamic_multiselect(label: str, column: str, current_df: pd.DataFrame):
         """
@@ -48,11 +199,7 @@ def smart_apply_filters(df: pd.DataFrame):
             st.sidebar.error(f"Column '{column}' not found.")
             st.error(f"Missing column: {column}.")
             return None
-        options = current_df[column].dropna().unique().tolist()
-        if column == "Month":
-            options = sorted(options, key=lambda m: MONTH_ORDER.get(m, 99))
-        else:
-            options = sorted(options)
+        options = sorted_options(current_df[column])
         selected = st.sidebar.multiselect(f"📌 {label}:", options, default=[], key=f"multiselect_{column}")
         if not selected:
             return options
@@ -82,8 +229,12 @@ def smart_apply_filters(df: pd.DataFrame):
     if selected_products is not None:
         filtered_df = filtered_df[filtered_df["Product"].isin(selected_products)]
     
+    # Drop categories emptied by the filters so dashboards can read option lists from them.
+    for col in filtered_df.select_dtypes("category").columns:
+        filtered_df[col] = filtered_df[col].cat.remove_unused_categories()
+    
     unit_column = "Tons"
     if unit_column in filtered_df.columns:
-        filtered_df[unit_column] = pd.to_numeric(filtered_df[unit_column], errors="coerce")
+        filtered_df = ensure_numeric(filtered_df, unit_column)
     
     return filtered_df, unit_column
@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from datetime import datetime
+from filters import build_period, ensure_numeric, period_datetimes, sorted_options
 
 def market_overview_dashboard(data: pd.DataFrame):
     st.title("📊 Market Overview Dashboard")
@@ -17,19 +17,15 @@ def market_overview_dashboard(data: pd.DataFrame):
         st.error(f"🚨 Missing columns: {', '.join(missing)}")
         return
 
-    data["Tons"] = pd.to_numeric(data["Tons"], errors="coerce")
+    data = ensure_numeric(data, "Tons")
 
     # Create an ordered "Period" field.
     if "Period" not in data.columns:
-        try:
-            data["Period_dt"] = data.apply(lambda row: datetime.strptime(f"{row['Month']} {row['Year']}", "%b %Y"), axis=1)
-        except Exception as e:
+        period = build_period(data)
+        if (period.codes == -1).any():
             st.error("Error parsing 'Month' and 'Year'. Ensure they are in 'Mon' format and numeric.")
             return
-        data["Period"] = data["Period_dt"].dt.strftime("%b-%Y")
-        sorted_periods = sorted(data["Period_dt"].dropna().unique())
-        period_labels = [dt.strftime("%b-%Y") for dt in sorted_periods]
-        data["Period"] = pd.Categorical(data["Period"], categories=period_labels, ordered=True)
+        data = data.assign(Period_dt=period_datetimes(period), Period=period)
     
     # Compute KPIs.
     total_imports = data["Tons"].sum()
@@ -62,7 +58,7 @@ def market_overview_dashboard(data: pd.DataFrame):
         col5.metric("MoM Growth (%)", f"{mom_growth:,.2f}")
         st.markdown("---")
         st.subheader("Market Share Overview")
-        cons_share = data.groupby("Consignee")["Tons"].sum().reset_index()
+        cons_share = data.groupby("Consignee", observed=True)["Tons"].sum().reset_index()
         total = cons_share["Tons"].sum()
         cons_share["Percentage"] = (cons_share["Tons"] / total) * 100
         fig_donut = px.pie(
@@ -77,7 +73,7 @@ def market_overview_dashboard(data: pd.DataFrame):
     
     with tab_trends:
         st.subheader("Overall Monthly Trends")
-        monthly_trends = data.groupby("Period")["Tons"].sum().reset_index()
+        monthly_trends = data.groupby("Period", observed=True)["Tons"].sum().reset_index()
         monthly_trends["Period_str"] = monthly_trends["Period"].astype(str)
         fig_line = px.line(
             monthly_trends, 
@@ -89,7 +85,7 @@ def market_overview_dashboard(data: pd.DataFrame):
         st.plotly_chart(fig_line, use_container_width=True)
         if data["Year"].nunique() > 1:
             st.markdown("#### Trends by Year")
-            yearly_trends = data.groupby(["Year", "Month"])["Tons"].sum().reset_index()
+            yearly_trends = data.groupby(["Year", "Month"], observed=True)["Tons"].sum().reset_index()
             month_order = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
                            "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
             yearly_trends["Month_Order"] = yearly_trends["Month"].map(month_order)
@@ -109,7 +105,7 @@ def market_overview_dashboard(data: pd.DataFrame):
         colA, colB = st.columns(2)
         with colA:
             st.markdown("**Top 5 Competitors (Consignees)**")
-            top_consignees = data.groupby("Consignee")["Tons"].sum().nlargest(5).reset_index()
+            top_consignees = data.groupby("Consignee", observed=True)["Tons"].sum().nlargest(5).reset_index()
             fig_top_comp = px.bar(
                 top_consignees,
                 x="Consignee",
@@ -122,7 +118,7 @@ def market_overview_dashboard(data: pd.DataFrame):
             st.plotly_chart(fig_top_comp, use_container_width=True)
         with colB:
             st.markdown("**Top 5 Exporters**")
-            top_exporters = data.groupby("Exporter")["Tons"].sum().nlargest(5).reset_index()
+            top_exporters = data.groupby("Exporter", observed=True)["Tons"].sum().nlargest(5).reset_index()
             fig_top_exp = px.bar(
                 top_exporters,
                 x="Exporter",
@@ -136,7 +132,7 @@ def market_overview_dashboard(data: pd.DataFrame):
         st.markdown("---")
         st.subheader("Importer/Exporter Contribution")
         st.markdown("This treemap shows how each importer (Consignee) is connected with various exporters. Segment size represents total Tons.")
-        contribution = data.groupby(["Consignee", "Exporter"])["Tons"].sum().reset_index()
+        contribution = data.groupby(["Consignee", "Exporter"], observed=True)["Tons"].sum().reset_index()
         fig_treemap = px.treemap(
             contribution,
             path=["Consignee", "Exporter"],
@@ -155,7 +151,7 @@ def market_overview_dashboard(data: pd.DataFrame):
         st.subheader("Custom Analysis")
         st.markdown("Here you can implement additional interactive analysis options. For example, select a specific state or product to drill down on detailed performance, or compare trends between different groups.")
         # Example: Let user select a Consignee State and view the corresponding data.
-        states = sorted(data["Consignee State"].dropna().unique().tolist())
+        states = sorted_options(data["Consignee State"])
         selected_state = st.selectbox("Select a State for Custom Analysis:", states, key="custom_state")
         state_data = data[data["Consignee State"] == selected_state]
         st.markdown(f"**Data for {selected_state}:**")
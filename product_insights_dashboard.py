@@ -5,6 +5,7 @@ import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.cluster import KMeans
 from rapidfuzz import process, fuzz
+from filters import build_period, classify_distinct, ensure_numeric
 
 # -------------------------------
 # Caching for heavy computations
@@ -74,11 +75,11 @@ def product_insights_dashboard(data: pd.DataFrame):
         st.error(f"🚨 Missing columns: {', '.join(missing)}")
         return
 
-    data["Tons"] = pd.to_numeric(data["Tons"], errors="coerce")
+    data = ensure_numeric(data, "Tons")
     
     # Create a "Period" field if not present.
     if "Period" not in data.columns:
-        data["Period"] = data["Month"] + "-" + data["Year"].astype(str)
+        data = data.assign(Period=build_period(data))
     
     # Generate candidate product categories using KMeans clustering.
     candidate_categories = generate_candidate_categories(data, num_clusters=5)
@@ -87,7 +88,7 @@ def product_insights_dashboard(data: pd.DataFrame):
     
     # Automatically classify products (if "Product" column is not already present).
     if "Product" not in data.columns:
-        data["Product"] = data["Mark"].apply(lambda x: classify_product(x, candidate_categories))
+        data = data.assign(Product=classify_distinct(data["Mark"], lambda m: classify_product(m, candidate_categories)))
     
     # --- Layout: Create Tabs ---
     tab_overview, tab_trends, tab_market_share, tab_details = st.tabs([
@@ -124,7 +125,7 @@ def product_insights_dashboard(data: pd.DataFrame):
     # ----- Tab 2: Trends -----
     with tab_trends:
         st.subheader("Overall Monthly Trends by Product")
-        trends_df = data.groupby(["Product", "Period"])["Tons"].sum().reset_index()
+        trends_df = data.groupby(["Product", "Period"], observed=True)["Tons"].sum().reset_index()
         fig_trends = px.line(
             trends_df,
             x="Period",
@@ -143,7 +144,7 @@ def product_insights_dashboard(data: pd.DataFrame):
         if not selected_products:
             selected_products = all_products
         detailed_trends = data[data["Product"].isin(selected_products)]
-        detailed_df = detailed_trends.groupby(["Product", "Period"])["Tons"].sum().reset_index()
+        detailed_df = detailed_trends.groupby(["Product", "Period"], observed=True)["Tons"].sum().reset_index()
         fig_detail = px.line(
             detailed_df,
             x="Period",
@@ -174,7 +175,8 @@ def product_insights_dashboard(data: pd.DataFrame):
             columns="Period",
             values="Tons",
             aggfunc="sum",
-            fill_value=0
+            fill_value=0,
+            observed=True
         )
         st.dataframe(pivot_table)
         
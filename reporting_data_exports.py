@@ -4,6 +4,7 @@ import io
 from datetime import datetime
 from sklearn.linear_model import LinearRegression
 import plotly.express as px
+from filters import build_period, ensure_numeric
 
 # =============================================================================
 # SUMMARY & INSIGHTS FUNCTIONS
@@ -38,7 +39,7 @@ def generate_auto_insights(df: pd.DataFrame) -> str:
         insights = []
         insights.append(f"Total imports are {total_tons:,.2f} tons over {total_records} records, averaging {avg_tons:,.2f} tons per record.")
         if "Consignee State" in df.columns:
-            state_agg = df.groupby("Consignee State")["Tons"].sum()
+            state_agg = df.groupby("Consignee State", observed=True)["Tons"].sum()
             top_state = state_agg.idxmax()
             top_state_tons = state_agg.max()
             insights.append(f"The top importing state is {top_state} with {top_state_tons:,.2f} tons.")
@@ -101,9 +102,9 @@ def overall_dashboard_report(data: pd.DataFrame):
         st.warning("⚠️ No data available. Please upload a dataset first.")
         return
     
-    data["Tons"] = pd.to_numeric(data["Tons"], errors="coerce")
+    data = ensure_numeric(data, "Tons")
     if "Period" not in data.columns:
-        data["Period"] = data["Month"] + "-" + data["Year"].astype(str)
+        data = data.assign(Period=build_period(data))
     
     # Global KPIs
     total_imports = data["Tons"].sum()
@@ -115,7 +116,7 @@ def overall_dashboard_report(data: pd.DataFrame):
     col2.metric("Total Records", total_records)
     col3.metric("Avg Tons per Record", f"{avg_tons:,.2f}")
     if "Consignee State" in data.columns:
-        state_agg = data.groupby("Consignee State")["Tons"].sum().reset_index()
+        state_agg = data.groupby("Consignee State", observed=True)["Tons"].sum().reset_index()
         top_state = state_agg.sort_values("Tons", ascending=False).iloc[0]
         col4.metric("Top State", f"{top_state['Consignee State']} ({top_state['Tons']:,.2f} Tons)")
     else:
@@ -137,21 +138,21 @@ def overall_dashboard_report(data: pd.DataFrame):
     # Market Overview Tab
     with tabs[0]:
         st.markdown("#### Overall Market Volume Trend")
-        market_trend = data.groupby("Period")["Tons"].sum().reset_index()
+        market_trend = data.groupby("Period", observed=True)["Tons"].sum().reset_index()
         fig_market = px.line(market_trend, x="Period", y="Tons", title="Market Volume Trend", markers=True)
         st.plotly_chart(fig_market, use_container_width=True)
     
     # Competitor Insights Tab
     with tabs[1]:
         st.markdown("#### Top Competitors by Volume")
-        comp_summary = data.groupby("Consignee")["Tons"].sum().reset_index().sort_values("Tons", ascending=False)
+        comp_summary = data.groupby("Consignee", observed=True)["Tons"].sum().reset_index().sort_values("Tons", ascending=False)
         fig_comp = px.bar(comp_summary.head(5), x="Consignee", y="Tons", title="Top 5 Competitors", text_auto=True, color="Tons")
         st.plotly_chart(fig_comp, use_container_width=True)
     
     # Supplier Performance Tab
     with tabs[2]:
         st.markdown("#### Top Suppliers by Volume")
-        supplier_agg = data.groupby("Exporter")["Tons"].sum().reset_index().sort_values("Tons", ascending=False)
+        supplier_agg = data.groupby("Exporter", observed=True)["Tons"].sum().reset_index().sort_values("Tons", ascending=False)
         fig_supplier = px.bar(supplier_agg.head(5), x="Exporter", y="Tons", title="Top 5 Suppliers", text_auto=True, color="Tons")
         st.plotly_chart(fig_supplier, use_container_width=True)
     
@@ -159,7 +160,7 @@ def overall_dashboard_report(data: pd.DataFrame):
     with tabs[3]:
         st.markdown("#### Imports by State")
         if "Consignee State" in data.columns:
-            state_agg = data.groupby("Consignee State")["Tons"].sum().reset_index().sort_values("Tons", ascending=False)
+            state_agg = data.groupby("Consignee State", observed=True)["Tons"].sum().reset_index().sort_values("Tons", ascending=False)
             fig_state = px.bar(state_agg, x="Consignee State", y="Tons", title="Imports by State", text_auto=True, color="Tons")
             st.plotly_chart(fig_state, use_container_width=True)
         else:
@@ -178,7 +179,7 @@ def overall_dashboard_report(data: pd.DataFrame):
     # Forecasting Tab
     with tabs[5]:
         st.markdown("#### Market Forecast")
-        market_df = data.groupby("Period")["Tons"].sum().reset_index().sort_values("Period").reset_index(drop=True)
+        market_df = data.groupby("Period", observed=True)["Tons"].sum().reset_index().sort_values("Period").reset_index(drop=True)
         if len(market_df) < 3:
             st.info("Not enough data to generate a forecast.")
         else:
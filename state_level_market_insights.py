@@ -1,7 +1,23 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from datetime import datetime
+from filters import MONTH_DTYPE, build_period, cap_rows, ensure_numeric, missing_columns, normalize_month, sorted_options, with_totals
+
+REQUIRED_COLUMNS = ("Consignee State", "Tons", "Month", "Year")
+
+@st.cache_data(show_spinner=False)
+def _state_totals(data: pd.DataFrame) -> pd.DataFrame:
+    """Total Tons per Consignee State."""
+    return data.groupby("Consignee State", observed=True, sort=False)["Tons"].sum().reset_index()
+
+@st.cache_data(show_spinner=False)
+def _state_year_period_totals(data: pd.DataFrame) -> pd.Series:
+    """
+    Sum Tons by (Consignee State, Year, Period) in a single pass over the data.
+    Every state/period and state/year view in the dashboard is derived from this result.
+    Rows without a Period are kept (as a missing Period) so the yearly view still counts them.
+    """
+    return data.groupby(["Consignee State", "Year", "Period"], observed=True, sort=False, dropna=False)["Tons"].sum()
 
 def state_level_market_insights(data: pd.DataFrame):
     st.title("🌍 State-Level Market Insights Dashboard")
@@ -11,34 +27,48 @@ def state_level_market_insights(data: pd.DataFrame):
         st.warning("⚠️ No data available. Please upload a dataset first.")
         return
 
-    required_columns = ["Consignee State", "Tons", "Month", "Year"]
-    missing = [col for col in required_columns if col not in data.columns]
+    missing = missing_columns(tuple(data.columns), REQUIRED_COLUMNS)
     if missing:
         st.error(f"🚨 Missing columns: {', '.join(missing)}")
         return
 
     # Ensure "Tons" is numeric.
-    data["Tons"] = pd.to_numeric(data["Tons"], errors="coerce")
+    data = ensure_numeric(data, "Tons")
     
-    # Create "Period" field if not present.
+    # An ordered Month categorical sorts chronologically and feeds the Period codes directly.
+    if data["Month"].dtype != MONTH_DTYPE:
+        data = data.assign(Month=normalize_month(data["Month"]))
+    
+    # Create an ordered "Period" field if not present.
     if "Period" not in data.columns:
-        data["Period"] = data["Month"] + "-" + data["Year"].astype(str)
+        data = data.assign(Period=build_period(data))
+
+    # Keep "Consignee State" categorical so sorted option lists come straight from its categories.
+    if not isinstance(data["Consignee State"].dtype, pd.CategoricalDtype):
+        data = data.assign(**{"Consignee State": data["Consignee State"].astype("category")})
+    all_states = sorted_options(data["Consignee State"])
+    all_periods = sorted_options(data["Period"])
+    
+    # Multi-state line charts render as static plots unless the user opts into interactivity.
+    interactive_charts = st.checkbox("Interactive multi-state charts", value=False, key="state_interactive_charts")
+    static_config = {"staticPlot": not interactive_charts}
     
-    # Predefined month ordering for proper sorting.
-    month_order = {
-        "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
-        "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12
-    }
+    # (State, Period) totals, sorted for line charts; Period determines Year, so dropping the level is lossless.
+    # Rows without a Period only feed the yearly view.
+    base_totals = _state_year_period_totals(data)
+    state_period = base_totals[base_totals.index.get_level_values("Period").notna()].droplevel("Year").sort_index()
     
-    # --- Tab Layout: Overview, Trends, Detailed Analysis ---
-    tab_overview, tab_trends, tab_detailed = st.tabs([
-        "Overview", "Trends", "Detailed Analysis"
-    ])
+    state_agg = _state_totals(data)
+    # The top 8 states by volume are drawn in the multi-state line charts.
+    top_trend_states = state_agg.nlargest(8, "Tons")["Consignee State"]
     
-    # ----- Tab 1: Overview -----
-    with tab_overview:
+    # --- View Selector: Overview, Trends, Detailed Analysis ---
+    # Unlike st.tabs, only the selected view's body runs on each rerun.
+    view = st.radio("View", ["Overview", "Trends", "Detailed Analysis"], horizontal=True, key="state_view")
+    
+    # ----- View 1: Overview -----
+    if view == "Overview":
         st.subheader("Key Performance Indicators")
-        state_agg = data.groupby("Consignee State")["Tons"].sum().reset_index()
         total_imports = state_agg["Tons"].sum()
         num_states = state_agg["Consignee State"].nunique()
         avg_imports = total_imports / num_states if num_states > 0 else 0
@@ -49,120 +79,115 @@ def state_level_market_insights(data: pd.DataFrame):
         col3.metric("Avg Tons per State", f"{avg_imports:,.2f}")
         st.markdown("<hr>", unsafe_allow_html=True)
         st.subheader("Top Importing States")
-        top_states = state_agg.sort_values("Tons", ascending=False).head(5)
+        top_states = state_agg.nlargest(5, "Tons")
         fig_bar = px.bar(
             top_states,
             x="Consignee State",
             y="Tons",
             title="Top 5 States by Tons",
             labels={"Tons": "Total Tons"},
-            text_auto=True,
-            color="Tons"
+            text_auto=".2s"
         )
         st.plotly_chart(fig_bar, use_container_width=True)
     
-    # ----- Tab 2: Trends -----
-    with tab_trends:
+    # ----- View 2: Trends -----
+    elif view == "Trends":
         st.subheader("Overall Monthly Trends by State")
-        trends_df = data.groupby(["Consignee State", "Period"])["Tons"].sum().reset_index()
+        trends_df = state_period.reset_index()
+        # Draw lines only for the top 8 states; one line per state is unreadable and slow to render.
+        top_trends_df = trends_df[trends_df["Consignee State"].isin(top_trend_states)]
         fig_trends = px.line(
-            trends_df,
+            top_trends_df,
             x="Period",
             y="Tons",
             color="Consignee State",
-            title="Monthly Trends by State",
-            markers=True
+            title="Monthly Trends for Top 8 States",
+            markers=True,
+            render_mode="webgl"
         )
-        st.plotly_chart(fig_trends, use_container_width=True)
+        st.plotly_chart(fig_trends, use_container_width=True, config=static_config)
+        # Only when states are left out of the lines, a heatmap covers all of them.
+        if len(state_agg) > len(top_trend_states):
+            fig_heatmap = px.density_heatmap(
+                trends_df,
+                x="Period",
+                y="Consignee State",
+                z="Tons",
+                histfunc="sum",
+                title="Monthly Imports by State"
+            )
+            st.plotly_chart(fig_heatmap, use_container_width=True)
         st.markdown("<hr>", unsafe_allow_html=True)
         st.subheader("Detailed Trends for Selected States")
-        all_states = sorted(data["Consignee State"].dropna().unique().tolist())
         selected_states = st.multiselect("Select States", options=all_states, default=all_states[:3], key="state_trends")
         if selected_states:
-            detailed_trends = data[data["Consignee State"].isin(selected_states)]
-            detailed_df = detailed_trends.groupby(["Consignee State", "Period"])["Tons"].sum().reset_index()
+            # States whose rows all lack a valid Period have no entries here and are simply not drawn.
+            detailed_df = state_period[state_period.index.isin(selected_states, level="Consignee State")].reset_index()
             fig_detail = px.line(
                 detailed_df,
                 x="Period",
                 y="Tons",
                 color="Consignee State",
                 title="Detailed Trends for Selected States",
-                markers=True
+                markers=True,
+                render_mode="webgl"
             )
             st.plotly_chart(fig_detail, use_container_width=True)
         else:
             st.info("Please select at least one state for detailed analysis.")
     
-    # ----- Tab 3: Detailed Analysis -----
-    with tab_detailed:
+    # ----- View 3: Detailed Analysis -----
+    else:
         st.subheader("Detailed State-Level Data")
+        # Tables show the top states by volume; the user can raise the cap.
+        max_rows = st.number_input("Rows to display", min_value=10, value=100, step=50, key="state_max_rows")
         # Pivot table of volumes by state and period.
-        detailed_pivot = data.pivot_table(
-            index="Consignee State",
-            columns="Period",
-            values="Tons",
-            aggfunc="sum",
-            fill_value=0
-        )
+        detailed_pivot = state_period.unstack("Period", fill_value=0)
         # Display the pivot table.
-        st.dataframe(detailed_pivot)
+        st.dataframe(cap_rows(detailed_pivot, max_rows))
         
         st.markdown("#### Summary Table by State")
-        summary_table = data.groupby("Consignee State")["Tons"].sum().reset_index().sort_values("Tons", ascending=False)
+        summary_table = state_agg.sort_values("Tons", ascending=False)
         st.dataframe(summary_table)
         
         # --- Expanders for Additional Analysis ---
         with st.expander("Monthly Analysis"):
             st.markdown("##### Monthly Volume and Trends")
-            all_periods = sorted(data["Period"].dropna().unique().tolist())
             selected_periods = st.multiselect("Select Period(s):", options=all_periods, default=all_periods, key="state_period")
-            monthly_pivot = data.pivot_table(
-                index="Consignee State",
-                columns="Period",
-                values="Tons",
-                aggfunc="sum",
-                fill_value=0
-            )
+            monthly_pivot = detailed_pivot
             if selected_periods:
                 monthly_pivot = monthly_pivot[[col for col in monthly_pivot.columns if col in selected_periods]]
-            monthly_pivot["Total"] = monthly_pivot.sum(axis=1)
-            monthly_total_row = pd.DataFrame(monthly_pivot.sum(axis=0)).T
-            monthly_total_row.index = ["Total"]
-            monthly_pivot_with_total = pd.concat([monthly_pivot, monthly_total_row])
-            st.dataframe(monthly_pivot_with_total)
-            monthly_trends = data.groupby(["Consignee State", "Period"])["Tons"].sum().reset_index()
+            monthly_pivot_with_total = with_totals(monthly_pivot)
+            st.dataframe(cap_rows(monthly_pivot_with_total, max_rows))
+            # Plot the same top-state subset as the Trends view; the pivot above still lists every state.
+            monthly_trends = state_period[state_period.index.isin(top_trend_states, level="Consignee State")].reset_index()
             fig_monthly = px.line(
                 monthly_trends,
                 x="Period",
                 y="Tons",
                 color="Consignee State",
-                title="Monthly Trends Comparison",
-                markers=True
+                title="Monthly Trends Comparison (Top 8 States)",
+                markers=True,
+                render_mode="webgl"
             )
-            st.plotly_chart(fig_monthly, use_container_width=True)
+            st.plotly_chart(fig_monthly, use_container_width=True, config=static_config)
         
         with st.expander("Yearly Analysis"):
             st.markdown("##### Yearly Volume and Trends")
-            yearly_pivot = data.pivot_table(
-                index="Consignee State",
-                columns="Year",
-                values="Tons",
-                aggfunc="sum",
-                fill_value=0
-            )
-            yearly_pivot["Total"] = yearly_pivot.sum(axis=1)
-            yearly_total_row = pd.DataFrame(yearly_pivot.sum(axis=0)).T
-            yearly_total_row.index = ["Total"]
-            yearly_pivot_with_total = pd.concat([yearly_pivot, yearly_total_row])
-            st.dataframe(yearly_pivot_with_total)
-            yearly_trends = data.groupby(["Consignee State", "Year"])["Tons"].sum().reset_index()
+            state_year = base_totals.groupby(level=["Consignee State", "Year"], observed=True).sum()
+            yearly_pivot = state_year.unstack("Year", fill_value=0)
+            yearly_pivot_with_total = with_totals(yearly_pivot)
+            st.dataframe(cap_rows(yearly_pivot_with_total, max_rows))
+            yearly_trends = state_year.reset_index()
+            yearly_trends = yearly_trends[yearly_trends["Consignee State"].isin(top_trend_states)]
             fig_yearly = px.line(
                 yearly_trends,
                 x="Year",
                 y="Tons",
                 color="Consignee State",
-                title="Yearly Trends Comparison",
-                markers=True
+                title="Yearly Trends Comparison (Top 8 States)",
+                markers=True,
+                render_mode="webgl"
             )
             st.plotly_chart(fig_yearly, use_container_width=True)
     
@@ -1,57 +1,254 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
 import numpy as np
-from datetime import datetime
+from filters import build_period, cap_rows, ensure_numeric, missing_columns, period_chart_frame, period_pct_change, with_totals
+
+REQUIRED_COLUMNS = ("Exporter", "Consignee", "Tons", "Month", "Year")
+
+# Largest Exporter x Consignee matrix (in cells, one byte each) counted densely.
+DENSE_PAIR_LIMIT = 16_000_000
+
+@st.cache_data(show_spinner=False)
+def _supplier_period_pivot(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Exporter x Period pivot of Tons.
+    Each row's (exporter, period) code pair indexes one cell of a dense matrix and
+    np.bincount scatter-adds Tons into it without sorting; only observed rows and
+    periods are kept.
+    """
+    exporter, period = data["Exporter"], data["Period"]
+    exp_codes = exporter.cat.codes.to_numpy().astype(np.int64)
+    per_codes = period.cat.codes.to_numpy().astype(np.int64)
+    tons = data["Tons"].to_numpy(dtype="float64", na_value=np.nan)
+    keep = (exp_codes >= 0) & (per_codes >= 0)
+    n_exporters, n_periods = len(exporter.cat.categories), len(period.cat.categories)
+    cells = exp_codes[keep] * n_periods + per_codes[keep]
+    shape = (n_exporters, n_periods)
+    sums = np.bincount(cells, weights=np.nan_to_num(tons[keep]), minlength=n_exporters * n_periods).reshape(shape)
+    seen = np.bincount(cells, minlength=n_exporters * n_periods).reshape(shape) > 0
+    row_codes = np.flatnonzero(seen.any(axis=1))
+    col_codes = np.flatnonzero(seen.any(axis=0))
+    return pd.DataFrame(
+        sums[np.ix_(row_codes, col_codes)],
+        index=pd.CategoricalIndex(pd.Categorical.from_codes(row_codes, dtype=exporter.dtype), name="Exporter"),
+        columns=pd.CategoricalIndex(pd.Categorical.from_codes(col_codes, dtype=period.dtype), name="Period"),
+    )
+
+@st.cache_data(show_spinner=False)
+def _supplier_stats(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Total, mean, sample standard deviation and coefficient of variation of Tons per Exporter.
+    Counts and sums are accumulated per exporter code with np.bincount, then a
+    second pass sums squared deviations from each group mean, which avoids the
+    cancellation of the sum-of-squares formula. Missing Tons are left out.
+    """
+    exporter = data["Exporter"]
+    codes = exporter.cat.codes.to_numpy()
+    tons = data["Tons"].to_numpy(dtype="float64", na_value=np.nan)
+    keep = codes >= 0
+    codes, tons = codes[keep], tons[keep]
+    n_groups = len(exporter.cat.categories)
+    observed = np.bincount(codes, minlength=n_groups) > 0
+    valid = ~np.isnan(tons)
+    codes, tons = codes[valid], tons[valid]
+    count = np.bincount(codes, minlength=n_groups)
+    total = np.bincount(codes, weights=tons, minlength=n_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(count > 0, total / count, np.nan)
+        deviation = tons - mean[codes]
+        sq_dev = np.bincount(codes, weights=deviation * deviation, minlength=n_groups)
+        std = np.where(count > 1, np.sqrt(sq_dev / (count - 1)), np.nan)
+        cv = np.where(mean > 0, std / mean * 100, 0)
+    return pd.DataFrame({
+        "Exporter": exporter.cat.categories[observed],
+        "Tons": total[observed],
+        "mean": mean[observed],
+        "std": std[observed],
+        "CV (%)": cv[observed],
+    })
+
+@st.cache_data(show_spinner=False)
+def _unique_importer_counts(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Number of distinct Consignees per Exporter.
+    Each (Exporter, Consignee) code pair marks one cell of a dense boolean matrix
+    whose row sums are the counts. Past `DENSE_PAIR_LIMIT` cells the pairs are
+    instead encoded as integers, deduplicated with np.unique and counted with np.bincount.
+    """
+    exporter, consignee = data["Exporter"], data["Consignee"]
+    exp_codes = exporter.cat.codes.to_numpy().astype(np.int64)
+    cons_codes = consignee.cat.codes.to_numpy().astype(np.int64)
+    keep = (exp_codes >= 0) & (cons_codes >= 0)
+    exp_codes, cons_codes = exp_codes[keep], cons_codes[keep]
+    n_exporters, n_consignees = len(exporter.cat.categories), len(consignee.cat.categories)
+    if n_exporters * n_consignees <= DENSE_PAIR_LIMIT:
+        seen = np.zeros((n_exporters, n_consignees), dtype=bool)
+        seen[exp_codes, cons_codes] = True
+        counts = seen.sum(axis=1)
+    else:
+        pairs = np.unique(exp_codes * n_consignees + cons_codes)
+        counts = np.bincount(pairs // n_consignees, minlength=n_exporters)
+    observed = counts > 0
+    return pd.DataFrame({
+        "Exporter": exporter.cat.categories[observed],
+        "Unique Importers": counts[observed],
+    })
+
+@st.cache_data(show_spinner=False)
+def _supplier_consignee_totals(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Total Tons per (Exporter, Consignee) pair.
+    Both codes are folded into one integer key; np.unique numbers the observed
+    pairs and np.bincount sums Tons into them in a single pass.
+    """
+    exporter, consignee = data["Exporter"], data["Consignee"]
+    exp_codes = exporter.cat.codes.to_numpy().astype(np.int64)
+    cons_codes = consignee.cat.codes.to_numpy().astype(np.int64)
+    tons = data["Tons"].to_numpy(dtype="float64", na_value=np.nan)
+    keep = (exp_codes >= 0) & (cons_codes >= 0)
+    n_consignees = len(consignee.cat.categories)
+    pairs, inverse = np.unique(exp_codes[keep] * n_consignees + cons_codes[keep], return_inverse=True)
+    totals = np.bincount(inverse, weights=np.nan_to_num(tons[keep]), minlength=len(pairs))
+    return pd.DataFrame({
+        "Exporter": pd.Categorical.from_codes(pairs // n_consignees, dtype=exporter.dtype),
+        "Consignee": pd.Categorical.from_codes(pairs % n_consignees, dtype=consignee.dtype),
+        "Tons": totals,
+    })
+
+@st.cache_data(show_spinner=False)
+def _supplier_year_totals(data: pd.DataFrame) -> pd.Series:
+    """Total Tons per (Exporter, Year); feeds both the yearly pivot and the yearly chart."""
+    return data.groupby(["Exporter", "Year"], observed=True)["Tons"].sum()
+
+def _top_n(totals: pd.DataFrame, k: int) -> pd.DataFrame:
+    """
+    The `k` rows of a totals frame with the largest Tons, largest first.
+    np.argpartition selects them in linear time; only those rows are sorted.
+    """
+    tons = totals["Tons"].to_numpy(dtype="float64", na_value=np.nan)
+    k = min(k, len(tons))
+    if k == 0:
+        return totals.iloc[:0]
+    top = np.argpartition(-tons, k - 1)[:k]
+    return totals.iloc[top[np.argsort(-tons[top], kind="stable")]]
+
+def _top_k_with_other(pivot: pd.DataFrame, k: int) -> pd.DataFrame:
+    """
+    The `k` pivot rows with the largest totals plus one "Other" row summing the rest,
+    so a line chart draws at most k + 1 lines however many suppliers there are.
+    """
+    if len(pivot) <= k:
+        return pivot
+    totals = pivot.to_numpy().sum(axis=1)
+    top = np.zeros(len(pivot), dtype=bool)
+    top[np.argpartition(-totals, k - 1)[:k]] = True
+    other = pd.DataFrame([pivot.to_numpy()[~top].sum(axis=0)], index=["Other"], columns=pivot.columns)
+    return pd.concat([pivot[top].set_axis(pivot.index[top].astype(object)), other])
+
+def _top_consignees_with_other(contrib: pd.DataFrame, k: int) -> pd.DataFrame:
+    """
+    Each exporter's `k` largest consignees plus one "Other" row per exporter
+    summing the rest, so the treemap draws at most k + 1 tiles per supplier.
+    """
+    rank = contrib.groupby("Exporter", observed=True)["Tons"].rank(method="first", ascending=False)
+    top = (rank <= k).to_numpy()
+    if top.all():
+        return contrib
+    other = contrib[~top].groupby("Exporter", observed=True)["Tons"].sum().reset_index().assign(Consignee="Other")
+    return pd.concat([contrib[top], other], ignore_index=True)
+
+def _trend_figure(pivot: pd.DataFrame, title: str) -> go.Figure:
+    """
+    Line chart with one WebGL trace per pivot row, built straight from the pivot's
+    arrays instead of a long-format frame; zero cells (no shipments) are skipped.
+    """
+    x = np.asarray(pivot.columns.to_list(), dtype=object)
+    fig = go.Figure()
+    for name, row in zip(pivot.index, pivot.to_numpy(dtype="float64")):
+        shipped = row != 0
+        fig.add_trace(go.Scattergl(x=x[shipped], y=row[shipped], mode="lines+markers", name=str(name)))
+    fig.update_layout(title=title, xaxis_title=pivot.columns.name, yaxis_title="Tons",
+                      legend_title_text=pivot.index.name)
+    # Keep chronological order on a category axis even when the first trace skips periods.
+    fig.update_xaxes(categoryorder="array", categoryarray=x.tolist())
+    return fig
+
+def _treemap_figure(contrib: pd.DataFrame, title: str) -> go.Figure:
+    """
+    Two-level Exporter -> Consignee treemap built from precomputed node arrays.
+    Supplier nodes come first with their totals (used for colour only; their size is
+    the sum of their importers), followed by one leaf per (Exporter, Consignee) row.
+    """
+    exporters = np.asarray(contrib["Exporter"].astype(str), dtype=str)
+    consignees = np.asarray(contrib["Consignee"].astype(str), dtype=str)
+    tons = contrib["Tons"].to_numpy(dtype="float64")
+    roots, inverse = np.unique(exporters, return_inverse=True)
+    root_tons = np.bincount(inverse, weights=tons, minlength=len(roots))
+    fig = go.Figure(go.Treemap(
+        ids=np.concatenate([roots, np.char.add(np.char.add(exporters, "/"), consignees)]),
+        parents=np.concatenate([np.full(len(roots), ""), exporters]),
+        labels=np.concatenate([roots, consignees]),
+        values=np.concatenate([np.zeros(len(roots)), tons]),
+        branchvalues="remainder",
+        marker=dict(colors=np.concatenate([root_tons, tons]), colorscale="Blues",
+                    colorbar=dict(title="Tons")),
+        hovertemplate="%{label}<br>Tons=%{value:,.2f}<extra></extra>"
+    ))
+    fig.update_layout(title=title)
+    return fig
 
 def supplier_performance_dashboard(data: pd.DataFrame):
     st.title("📊 Supplier Performance Dashboard")
     
     # --- Data Validation ---
-    required_columns = ["Exporter", "Consignee", "Tons", "Month", "Year"]
     if data is None or data.empty:
         st.warning("⚠️ No data available. Please upload a dataset first.")
         return
-    missing = [col for col in required_columns if col not in data.columns]
+    missing = missing_columns(tuple(data.columns), REQUIRED_COLUMNS)
     if missing:
         st.error(f"🚨 Missing columns: {', '.join(missing)}")
         return
 
     # Ensure 'Tons' is numeric.
-    data["Tons"] = pd.to_numeric(data["Tons"], errors="coerce")
+    data = ensure_numeric(data, "Tons")
     
-    # Create a "Period" field if not already present.
+    # Categorical keys let every aggregation below work on integer codes; the helpers rely on it.
+    for col in ("Exporter", "Consignee"):
+        if not isinstance(data[col].dtype, pd.CategoricalDtype):
+            data = data.assign(**{col: data[col].astype("category")})
+    
+    # Create an ordered "Period" field if not already present.
     if "Period" not in data.columns:
-        data["Period"] = data["Month"] + "-" + data["Year"].astype(str)
+        data = data.assign(Period=build_period(data))
     
-    # Define month ordering for sorting.
-    month_order = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
-                   "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
-
-    # --- Tab Layout ---
-    # We create four main tabs:
+    # Per-supplier totals and risk statistics come from one cached pass; the totals
+    # and the top-10 ranking are shared by every view.
+    supplier_stats = _supplier_stats(data)
+    supplier_agg = supplier_stats[["Exporter", "Tons"]]
+    top10_suppliers = _top_n(supplier_agg, 10)["Exporter"]
+    
+    # --- View Selector ---
+    # We offer four views:
     # 1. Key Metrics
     # 2. Top Suppliers
     # 3. Trends & Risk Analysis (with additional expanders for detailed monthly and yearly analysis)
     # 4. Importer Connections
-    tab_kpis, tab_top, tab_trends, tab_importers = st.tabs([
+    # Unlike st.tabs, only the selected view's body runs on each rerun.
+    view = st.radio("View", [
         "Key Metrics", "Top Suppliers", "Trends & Risk Analysis", "Importer Connections"
-    ])
+    ], horizontal=True, key="sp_view")
 
-    # ----- Tab 1: Key Metrics -----
-    with tab_kpis:
+    # ----- View 1: Key Metrics -----
+    if view == "Key Metrics":
         st.subheader("Supplier Key Performance Indicators")
-        # Aggregate supplier performance by Exporter.
-        supplier_agg = data.groupby("Exporter")["Tons"].sum().reset_index()
         total_volume = supplier_agg["Tons"].sum()
         num_suppliers = supplier_agg["Exporter"].nunique()
         avg_volume = total_volume / num_suppliers if num_suppliers > 0 else 0
 
-        # Compute risk metrics: mean, std dev, and coefficient of variation (CV).
-        risk_stats = data.groupby("Exporter")["Tons"].agg(["mean", "std"]).reset_index()
-        risk_stats["CV (%)"] = np.where(risk_stats["mean"] > 0, (risk_stats["std"] / risk_stats["mean"]) * 100, 0)
-        avg_std = risk_stats["std"].mean() if not risk_stats.empty else 0
-        avg_cv = risk_stats["CV (%)"].mean() if not risk_stats.empty else 0
+        # Risk metrics: average std dev and coefficient of variation (CV) across suppliers.
+        avg_std = supplier_stats["std"].mean() if not supplier_stats.empty else 0
+        avg_cv = supplier_stats["CV (%)"].mean() if not supplier_stats.empty else 0
 
         col1, col2, col3, col4, col5 = st.columns(5)
         col1.metric("Total Volume (Tons)", f"{total_volume:,.2f}")
@@ -60,122 +257,98 @@ def supplier_performance_dashboard(data: pd.DataFrame):
         col4.metric("Avg Std Dev (Tons)", f"{avg_std:,.2f}")
         col5.metric("Avg CV (%)", f"{avg_cv:,.2f}")
 
-    # ----- Tab 2: Top Suppliers -----
-    with tab_top:
+    # ----- View 2: Top Suppliers -----
+    elif view == "Top Suppliers":
         st.subheader("Top Suppliers by Volume")
         top_n = st.selectbox("Select number of top suppliers to display:", [5, 10, 15, 20, 25], index=0, key="sp_top_n")
-        top_suppliers = supplier_agg.nlargest(top_n, "Tons")
-        fig_top = px.bar(
-            top_suppliers,
-            x="Exporter",
-            y="Tons",
-            title=f"Top {top_n} Suppliers by Volume",
-            labels={"Tons": "Total Tons"},
-            text_auto=True,
-            color="Tons"
-        )
+        top_suppliers = _top_n(supplier_agg, top_n)
+        fig_top = go.Figure(go.Bar(
+            x=top_suppliers["Exporter"].to_numpy(dtype=object),
+            y=top_suppliers["Tons"].to_numpy(),
+            texttemplate="%{y:.2s}"
+        ))
+        fig_top.update_layout(title=f"Top {top_n} Suppliers by Volume", xaxis_title="Exporter",
+                              yaxis_title="Total Tons")
         st.plotly_chart(fig_top, use_container_width=True)
     
-    # ----- Tab 3: Trends & Risk Analysis -----
-    with tab_trends:
+    # ----- View 3: Trends & Risk Analysis -----
+    elif view == "Trends & Risk Analysis":
         st.subheader("Supplier Performance Trends")
-        trends_df = data.groupby(["Exporter", "Period"])["Tons"].sum().unstack(fill_value=0)
-        st.line_chart(trends_df)
+        trends_df = _supplier_period_pivot(data)
+        # Top-10 suppliers with at least one valid Period, in ranking order. Every such supplier
+        # also has a valid Year, so the yearly pivot holds them too. The Arrow-backed categorical
+        # index has to be listed first: isin against it directly raises an Arrow type error.
+        top10_present = top10_suppliers[top10_suppliers.isin(trends_df.index.tolist())]
+        # Plot the largest suppliers individually and fold the rest into an "Other" line.
+        top_k = st.slider("Suppliers plotted individually", min_value=1, max_value=max(len(trends_df), 2),
+                          value=min(10, max(len(trends_df), 1)), key="sp_trend_top_k")
+        st.line_chart(period_chart_frame(_top_k_with_other(trends_df, top_k)))
         
         st.markdown("---")
         st.subheader("Detailed Growth Analysis")
         # Toggle: Show only top 10 suppliers or all.
         show_top_growth = st.checkbox("Show only top 10 suppliers", value=True, key="sp_show_top_growth")
         if show_top_growth:
-            candidate_suppliers = supplier_agg.nlargest(10, "Tons")["Exporter"].tolist()
+            candidate_suppliers = top10_suppliers.tolist()
         else:
-            candidate_suppliers = sorted(data["Exporter"].dropna().unique().tolist())
+            # The cached stats hold every observed exporter in category (sorted) order.
+            candidate_suppliers = supplier_agg["Exporter"].tolist()
             
         if candidate_suppliers:
             selected_supplier = st.selectbox("Select Supplier for Growth Analysis:", candidate_suppliers, key="sp_growth")
-            supplier_data = data[data["Exporter"] == selected_supplier].groupby("Period")["Tons"].sum()
-            growth_pct = supplier_data.pct_change() * 100
+            # Reuse the trends pivot row instead of re-filtering and regrouping the full data;
+            # periods without shipments are zero-filled there, so drop them from the series.
+            # A supplier without any valid Period has no row and comes back all zero.
+            supplier_data = trends_df.reindex([selected_supplier], fill_value=0).iloc[0]
+            volumes = supplier_data.to_numpy(dtype="float64")
+            shipped = volumes != 0
             growth_df = pd.DataFrame({
-                "Period": growth_pct.index,
-                "Percentage Change (%)": growth_pct.values
-            }).reset_index(drop=True)
+                "Period": supplier_data.index[shipped],
+                "Percentage Change (%)": period_pct_change(volumes[shipped])
+            })
             st.markdown(f"#### Period-over-Period Growth for {selected_supplier}")
             st.dataframe(growth_df)
         else:
             st.info("No data available for growth analysis.")
         
         # --- Additional Expanders for Detailed Pivot Analysis ---
+        # Pivot tables show the top suppliers by volume; the user can raise the cap.
+        max_rows = st.number_input("Rows to display", min_value=10, value=100, step=50, key="sp_max_rows")
         with st.expander("Monthly Analysis"):
             st.markdown("##### Monthly Volume & Trends")
-            monthly_pivot = data.pivot_table(
-                index="Exporter",
-                columns="Period",
-                values="Tons",
-                aggfunc="sum",
-                fill_value=0
-            )
-            monthly_pivot["Total"] = monthly_pivot.sum(axis=1)
-            total_row = pd.DataFrame(monthly_pivot.sum(axis=0)).T
-            total_row.index = ["Total"]
-            monthly_pivot_with_total = pd.concat([monthly_pivot, total_row])
-            st.dataframe(monthly_pivot_with_total)
-            monthly_trends = data.groupby(["Exporter", "Period"])["Tons"].sum().reset_index()
-            fig_monthly = px.line(
-                monthly_trends,
-                x="Period",
-                y="Tons",
-                color="Exporter",
-                title="Monthly Trends Comparison",
-                markers=True
-            )
+            monthly_pivot_with_total = with_totals(trends_df)
+            st.dataframe(cap_rows(monthly_pivot_with_total, max_rows))
+            # Plot only the top 10 suppliers; one line per supplier is unreadable and slow to render.
+            # Their rows come straight from the cached pivot.
+            fig_monthly = _trend_figure(trends_df.loc[top10_present],
+                                        "Monthly Trends Comparison (Top 10 Suppliers)")
             st.plotly_chart(fig_monthly, use_container_width=True)
         
         with st.expander("Yearly Analysis"):
             st.markdown("##### Yearly Volume & Trends")
-            yearly_pivot = data.pivot_table(
-                index="Exporter",
-                columns="Year",
-                values="Tons",
-                aggfunc="sum",
-                fill_value=0
-            )
-            yearly_pivot["Total"] = yearly_pivot.sum(axis=1)
-            yearly_total_row = pd.DataFrame(yearly_pivot.sum(axis=0)).T
-            yearly_total_row.index = ["Total"]
-            yearly_pivot_with_total = pd.concat([yearly_pivot, yearly_total_row])
-            st.dataframe(yearly_pivot_with_total)
-            yearly_trends = data.groupby(["Exporter", "Year"])["Tons"].sum().reset_index()
-            fig_yearly = px.line(
-                yearly_trends,
-                x="Year",
-                y="Tons",
-                color="Exporter",
-                title="Yearly Trends Comparison",
-                markers=True
-            )
+            supplier_year = _supplier_year_totals(data)
+            yearly_pivot = supplier_year.unstack("Year", fill_value=0)
+            yearly_pivot_with_total = with_totals(yearly_pivot)
+            st.dataframe(cap_rows(yearly_pivot_with_total, max_rows))
+            fig_yearly = _trend_figure(yearly_pivot.loc[top10_present],
+                                       "Yearly Trends Comparison (Top 10 Suppliers)")
             st.plotly_chart(fig_yearly, use_container_width=True)
     
-    # ----- Tab 4: Importer Connections -----
-    with tab_importers:
+    # ----- View 4: Importer Connections -----
+    else:
         st.subheader("Importer Connections per Supplier")
         st.markdown("This view shows, for each supplier (Exporter), the relationship with its unique importers (Consignees).")
-        contrib = data.groupby(["Exporter", "Consignee"])["Tons"].sum().reset_index()
-        fig_tree = px.treemap(
-            contrib,
-            path=["Exporter", "Consignee"],
-            values="Tons",
-            title="Importer Connections Treemap",
-            color="Tons",
-            color_continuous_scale="Blues",
-            hover_data={"Tons": True}
-        )
+        # Draw only the largest suppliers and their top 10 importers; every (Exporter, Consignee)
+        # pair is too heavy to render, so each supplier's remaining importers share an "Other" tile.
+        tree_n = st.selectbox("Select number of suppliers in the treemap:", [10, 25, 50, 100], index=1, key="sp_tree_n")
+        contrib = _supplier_consignee_totals(data)
+        contrib = contrib[contrib["Exporter"].isin(_top_n(supplier_agg, tree_n)["Exporter"])]
+        contrib = _top_consignees_with_other(contrib, 10)
+        fig_tree = _treemap_figure(contrib, f"Importer Connections Treemap (Top {tree_n} Suppliers)")
         st.plotly_chart(fig_tree, use_container_width=True)
         st.markdown("---")
         st.subheader("Detailed Importer Connections Table")
-        unique_conn = data.drop_duplicates(subset=["Exporter", "Consignee"])
-        pivot_table = unique_conn.groupby("Exporter")["Consignee"].nunique().reset_index()
-        pivot_table.columns = ["Exporter", "Unique Importers"]
-        pivot_table = pivot_table.sort_values("Unique Importers", ascending=False)
+        pivot_table = _unique_importer_counts(data).sort_values("Unique Importers", ascending=False)
         st.dataframe(pivot_table)
     
     st.success("✅ Supplier Performance Dashboard Loaded Successfully!")